@@ -0,0 +1,151 @@
+"""UI-free core helpers for the AI Manuscript Editor.
+
+Nothing in this module touches Streamlit, so the app script stays a thin
+UI layer and these pieces can be imported, cached, or tested in isolation
+without spinning up a browser session.
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from io import BytesIO
+
+# Conversation windowing / call sizing
+CONTEXT_WINDOW_DEFAULT = 4
+MAX_INPUT_TOKENS = 8000
+SUMMARY_MODEL = "gpt-4o-mini"
+MAX_CONCURRENT_REQUESTS = 8
+RESPONSE_TOKEN_BUDGET = 4096
+MODEL_CONTEXTS = {
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_000_000,
+    "claude-sonnet-4-20250514": 200_000
+}
+
+# Rate limiting defaults (requests/min and tokens/min per provider)
+RPM_DEFAULTS = {"openai": 500, "anthropic": 300}
+TPM_DEFAULTS = {"openai": 200_000, "anthropic": 100_000}
+
+# Manuscript auto-chunking
+AUTO_CHUNK_THRESHOLD = 4000
+CHUNK_MAX_TOKENS = 3000
+CHUNK_OVERLAP_TOKENS = 200
+
+# Caching
+SEMANTIC_CACHE_THRESHOLD = 0.95
+EMBEDDING_MODEL = "text-embedding-3-small"
+RESPONSE_MEMO_MAX = 256
+
+def decode_txt(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+def response_cache_key(model, messages, system_prompt, manuscript):
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt,
+            "manuscript": manuscript,
+            "messages": [(m["role"], m["content"]) for m in messages],
+        },
+        sort_keys=True,
+    )
+    return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
+# Compose the per-provider system payload once per (persona, manuscript)
+# pair instead of rebuilding a manuscript-sized string on every call in the
+# fanout. The SDKs don't mutate these, so sharing the objects is safe.
+#
+# Ordering matters for provider-side prompt caching: the stable parts
+# (persona, then manuscript) always come first and byte-identical, volatile
+# turns last, so OpenAI's automatic prefix cache and Anthropic's
+# cache_control breakpoint both hit on every follow-up.
+@lru_cache(maxsize=32)
+def composed_system_prompt(system_prompt, manuscript):
+    return f"{system_prompt}\n\nManuscript:\n{manuscript}"
+
+@lru_cache(maxsize=32)
+def anthropic_system_blocks(system_prompt, manuscript):
+    return [
+        {"type": "text", "text": system_prompt},
+        {"type": "text", "text": f"Manuscript:\n{manuscript}", "cache_control": {"type": "ephemeral"}}
+    ]
+
+def estimate_call_tokens(messages, system_prompt, manuscript):
+    # ~4 chars/token plus the full completion budget
+    prompt_chars = len(system_prompt) + len(manuscript) + sum(len(m["content"]) for m in messages)
+    return prompt_chars // 4 + RESPONSE_TOKEN_BUDGET
+
+def chunk_text(text, enc, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Split text into overlapping token windows using the given encoding."""
+    tokens = enc.encode(text)
+    chunks = []
+    step = max_tokens - overlap
+    for start in range(0, len(tokens), step):
+        chunks.append(enc.decode(tokens[start:start + max_tokens]))
+        if start + max_tokens >= len(tokens):
+            break
+    return chunks
+
+def _save_docx_fast(doc, buffer):
+    """Save a python-docx Document with light ZIP compression.
+
+    python-docx compresses the OOXML package at the default deflate level;
+    level 1 is severalfold faster on manuscript-sized documents for a
+    negligible size increase. The writer class is private API, so if a
+    python-docx upgrade moves it we fall back to the stock save path.
+    """
+    try:
+        import zipfile
+        from docx.opc.phys_pkg import _ZipPkgWriter
+    except ImportError:
+        doc.save(buffer)
+        return
+
+    original_init = _ZipPkgWriter.__init__
+
+    def _fast_init(self, pkg_file):
+        self._zipf = zipfile.ZipFile(
+            pkg_file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+        )
+
+    _ZipPkgWriter.__init__ = _fast_init
+    try:
+        doc.save(buffer)
+    finally:
+        _ZipPkgWriter.__init__ = original_init
+
+def build_docx_bytes(editor_name: str, editor_prompt: str, manuscript: str, convo_snapshot: tuple) -> bytes:
+    """Assemble the export document and return its serialized bytes.
+
+    python-docx is imported lazily so sessions that never export skip the
+    import cost entirely.
+    """
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading('AI Manuscript Editor - Full Conversation', 0)
+    doc.add_paragraph(f'Editor Persona: {editor_name}')
+    doc.add_paragraph(f'Original Feedback Request: {editor_prompt}')
+    doc.add_paragraph('')
+    doc.add_heading('Original Manuscript Excerpt', level=1)
+    doc.add_paragraph(manuscript)
+    doc.add_paragraph('')
+
+    for model, messages in convo_snapshot:
+        doc.add_heading(f'Conversation with {model}', level=1)
+
+        for j, (role, content) in enumerate(messages):
+            if role == "user":
+                if j == 0:
+                    doc.add_heading('Original Request', level=2)
+                else:
+                    doc.add_heading('Follow-up Question', level=2)
+                doc.add_paragraph(content)
+            elif role == "assistant" and not content.startswith(("❌ Error:", "⚠️ Skipped:")):
+                doc.add_heading('Response', level=2)
+                doc.add_paragraph(content)
+            doc.add_paragraph('')
+
+    buffer = BytesIO()
+    _save_docx_fast(doc, buffer)
+    return buffer.getvalue()
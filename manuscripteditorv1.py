@@ -1,9 +1,46 @@
-import streamlit as st
-import openai
-import anthropic
+import asyncio
+import hashlib
+import json
 import os
-from io import BytesIO
-from docx import Document
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import diskcache
+import httpx
+import numpy as np
+import openai
+from aiolimiter import AsyncLimiter
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import tenacity
+import tiktoken
+
+from editor_core import (
+    AUTO_CHUNK_THRESHOLD,
+    CONTEXT_WINDOW_DEFAULT,
+    EMBEDDING_MODEL,
+    MAX_CONCURRENT_REQUESTS,
+    MAX_INPUT_TOKENS,
+    MODEL_CONTEXTS,
+    RESPONSE_MEMO_MAX,
+    RESPONSE_TOKEN_BUDGET,
+    RPM_DEFAULTS,
+    SEMANTIC_CACHE_THRESHOLD,
+    SUMMARY_MODEL,
+    TPM_DEFAULTS,
+    anthropic_system_blocks,
+    build_docx_bytes,
+    chunk_text,
+    composed_system_prompt,
+    decode_txt,
+    estimate_call_tokens,
+    response_cache_key,
+)
+
+# anthropic and python-docx are imported lazily at first use: a session that
+# only has an OpenAI key never pays the Anthropic import, and the DOCX import
+# is deferred until the first export build.
 
 # Set up Streamlit
 st.set_page_config(page_title="AI Manuscript Editor", layout="wide")
@@ -15,6 +52,30 @@ if "conversation_history" not in st.session_state:
 if "feedback_generated" not in st.session_state:
     st.session_state.feedback_generated = False
 
+# Content-addressed response cache: identical (model, system prompt, messages)
+# queries return instantly instead of re-paying API latency and spend
+@st.cache_resource
+def get_response_cache():
+    return diskcache.Cache(".llm_cache")
+
+# In-process memo in front of the disk cache: repeat hits within a session
+# skip the disk read and deserialize entirely. Evicts oldest-first past
+# RESPONSE_MEMO_MAX entries so long sessions don't grow session state unboundedly.
+def memo_cache_get(cache_key):
+    memo = st.session_state.setdefault("response_memo", {})
+    cached = memo.get(cache_key)
+    if cached is None:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            memo_cache_put(cache_key, cached)
+    return cached
+
+def memo_cache_put(cache_key, text):
+    memo = st.session_state.setdefault("response_memo", {})
+    memo[cache_key] = text
+    while len(memo) > RESPONSE_MEMO_MAX:
+        memo.pop(next(iter(memo)))
+
 # Instructions dropdown that remains persistent
 with st.expander("📖 How to Use This App & Get API Keys", expanded=False):
     st.markdown("""
@@ -91,15 +152,94 @@ with col2:
         help="Get your key at: https://console.anthropic.com/"
     )
 
-# Set up API clients
+# All async work runs on one persistent background event loop instead of a
+# fresh asyncio.run() loop per interaction. Keep-alive connections in the
+# shared HTTP pool are bound to the loop they were opened on, so short-lived
+# loops would strand them and later calls would fail with "Event loop is
+# closed"; a single long-lived loop keeps the pool warm and valid all session.
+#
+# Everything here is keyed by Streamlit session id: a process-wide loop thread
+# would have every session re-attaching its own script run context to the same
+# thread, so one user's in-flight coroutines could write streamed responses
+# and conversation state into another user's session.
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else ""
+
+@st.cache_resource(show_spinner=False)
+def _session_async_loop(session_id: str):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True)
+    thread.start()
+    return loop, thread
+
+def get_async_loop():
+    return _session_async_loop(_session_id())
+
+def run_async(coro):
+    loop, thread = get_async_loop()
+    # Re-attach the current script run context each call so coroutines can
+    # read st.session_state and stream into placeholders from the loop thread
+    add_script_run_ctx(thread, get_script_run_ctx())
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+# Set up API clients. Construction is cached per (session, API key) so reruns
+# (every keystroke in a text_area) reuse the same client and its warm
+# connection pool instead of rebuilding TLS/HTTP state each time. The pool is
+# per-session because its connections live on that session's event loop.
+# One HTTP/2 connection pool shared by both provider SDKs, so every call
+# reuses warm keep-alive connections instead of paying a fresh TLS handshake
+@st.cache_resource(show_spinner=False)
+def get_shared_http_client(session_id: str):
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=60
+    )
+
+# Fire a trivial request in the background as soon as a client is built, so
+# DNS resolution and the TCP + TLS handshake happen while the user is still
+# typing instead of inflating the first feedback call. The probe runs on the
+# same persistent loop as real calls, so the connections it opens are exactly
+# the ones the first feedback call will reuse. models.list() on the async
+# SDKs returns an awaitable paginator, so it must be awaited inside a real
+# coroutine rather than handed to the loop directly.
+def _warm_connection(list_models):
+    async def _warm():
+        try:
+            await list_models()
+        except Exception:
+            pass  # warmup is best-effort; a bad key fails loudly on real use
+    loop, _ = get_async_loop()
+    asyncio.run_coroutine_threadsafe(_warm(), loop)
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key: str, session_id: str):
+    client = openai.AsyncOpenAI(api_key=api_key, http_client=get_shared_http_client(session_id))
+    _warm_connection(client.models.list)
+    return client
+
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key: str, session_id: str):
+    import anthropic
+    client = anthropic.AsyncAnthropic(api_key=api_key, http_client=get_shared_http_client(session_id))
+    _warm_connection(client.models.list)
+    return client
+
 openai_client = None
 anthropic_client = None
 
 if st.session_state.openai_api_key:
-    openai_client = openai.OpenAI(api_key=st.session_state.openai_api_key)
+    openai_client = get_openai_client(st.session_state.openai_api_key, _session_id())
 
 if st.session_state.anthropic_api_key:
-    anthropic_client = anthropic.Anthropic(api_key=st.session_state.anthropic_api_key)
+    anthropic_client = get_anthropic_client(st.session_state.anthropic_api_key, _session_id())
+
+if st.button("🧹 Clear cached responses", help="Forget previously cached model responses and re-query the APIs."):
+    st.cache_data.clear()
+    get_response_cache().clear()
+    st.session_state.pop("response_memo", None)
+    st.success("✅ Response cache cleared!")
 
 # Choose models
 openai_models = ["gpt-4o", "gpt-4.1"]
@@ -128,6 +268,18 @@ if not selected_models:
     st.warning("Please select at least one model.")
     st.stop()
 
+# Defensive: one request per distinct model, preserving selection order
+selected_models = list(dict.fromkeys(selected_models))
+
+st.slider(
+    "💭 Context window (turns)",
+    min_value=2,
+    max_value=20,
+    value=CONTEXT_WINDOW_DEFAULT,
+    key="context_window",
+    help="How many recent conversation turns are sent with each follow-up. Older turns are summarized to keep per-call cost flat."
+)
+
 # Editor configuration
 st.subheader("👤 Editor Configuration")
 editor_name = st.text_input(
@@ -145,14 +297,59 @@ manuscript_input = st.text_area(
 )
 
 uploaded_file = st.file_uploader(
-    "Or upload a .txt file", 
+    "Or upload a .txt file",
     type="txt",
     help="Upload a plain text file containing your manuscript excerpt."
 )
 
+# Decode the upload once per unique file - reruns reuse the cached string
+# instead of re-reading and re-decoding the whole buffer every interaction
+@st.cache_data(show_spinner=False)
+def load_txt(data: bytes) -> str:
+    return decode_txt(data)
+
 if uploaded_file:
-    manuscript_input = uploaded_file.read().decode("utf-8")
-    st.success("✅ Manuscript text loaded from file!")
+    manuscript_input = load_txt(uploaded_file.getvalue())
+    st.success(f"✅ Manuscript text loaded from file ({len(manuscript_input):,} characters)!")
+
+chunk_separator = st.text_input(
+    "✂️ Chunk separator (optional)",
+    value="",
+    help="If set (e.g. ---), the manuscript is split on this separator and each chunk gets its own parallel feedback request."
+)
+
+# get_encoding must be defined before the token caption below runs - the
+# script executes top-down on every rerun, so a later definition would
+# NameError the first time manuscript text is present
+@st.cache_resource
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+# Tokenize once per unique manuscript so the count and context-window check
+# are free on reruns
+@st.cache_data(show_spinner=False)
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text))
+
+# Manuscripts past AUTO_CHUNK_THRESHOLD tokens are split into overlapping token
+# windows and fanned out per chunk, then synthesized, instead of one slow
+# long-context call
+@st.cache_data(show_spinner=False)
+def chunk_manuscript(text: str, model: str) -> list:
+    return chunk_text(text, get_encoding(model))
+
+if manuscript_input:
+    manuscript_tokens = count_tokens(manuscript_input, "gpt-4o")
+    st.caption(f"📏 Manuscript length: {manuscript_tokens:,} tokens")
+    smallest_context = min(MODEL_CONTEXTS.get(m, 128_000) for m in selected_models)
+    if manuscript_tokens > smallest_context - 2000:
+        st.warning(
+            f"⚠️ The manuscript ({manuscript_tokens:,} tokens) is close to or over the smallest selected model's "
+            f"context window ({smallest_context:,} tokens). Consider splitting it with the chunk separator above."
+        )
 
 # Feedback prompt
 st.subheader("🎯 Feedback Request")
@@ -162,36 +359,508 @@ editor_prompt = st.text_area(
     help="Be specific about what aspects you want feedback on for the most helpful results."
 )
 
-# Function to get AI response
-def get_ai_response(model, messages, system_prompt):
+# Dual token-bucket rate limiters per provider - one bucket counts requests
+# (RPM), the other counts estimated tokens (TPM) - shared by every in-flight
+# call in a fanout so bursts pace themselves to the account's actual budget
+# instead of triggering 429 storms. All calls share the persistent background
+# loop, and the dicts reset on every script rerun, so moving a slider takes
+# effect on the next run's limiters.
+_rate_limiters = {}
+_token_limiters = {}
+
+def get_rate_limiter(provider):
+    key = (id(asyncio.get_running_loop()), provider)
+    if key not in _rate_limiters:
+        rpm = st.session_state.get(f"{provider}_rpm", RPM_DEFAULTS[provider])
+        _rate_limiters[key] = AsyncLimiter(max_rate=rpm, time_period=60)
+    return _rate_limiters[key]
+
+def get_token_limiter(provider):
+    key = (id(asyncio.get_running_loop()), provider)
+    if key not in _token_limiters:
+        tpm = st.session_state.get(f"{provider}_tpm", TPM_DEFAULTS[provider])
+        _token_limiters[key] = AsyncLimiter(max_rate=tpm, time_period=60)
+    return _token_limiters[key]
+
+async def acquire_rate_budget(provider, estimated_tokens):
+    tpm = st.session_state.get(f"{provider}_tpm", TPM_DEFAULTS[provider])
+    await get_rate_limiter(provider).acquire()
+    await get_token_limiter(provider).acquire(min(estimated_tokens, tpm))
+
+with st.sidebar:
+    st.header("🚦 Rate Limits")
+    st.slider(
+        "Max concurrent requests",
+        min_value=1,
+        max_value=32,
+        value=MAX_CONCURRENT_REQUESTS,
+        key="max_concurrency",
+        help="Upper bound on simultaneous in-flight API calls during chunked fanouts."
+    )
+    st.slider(
+        "OpenAI requests/min",
+        min_value=10,
+        max_value=10_000,
+        value=RPM_DEFAULTS["openai"],
+        key="openai_rpm",
+        help="Match this to your OpenAI account's RPM limit."
+    )
+    st.slider(
+        "Anthropic requests/min",
+        min_value=10,
+        max_value=10_000,
+        value=RPM_DEFAULTS["anthropic"],
+        key="anthropic_rpm",
+        help="Match this to your Anthropic account's RPM limit."
+    )
+    st.slider(
+        "OpenAI tokens/min",
+        min_value=10_000,
+        max_value=2_000_000,
+        value=TPM_DEFAULTS["openai"],
+        step=10_000,
+        key="openai_tpm",
+        help="Match this to your OpenAI account's TPM limit."
+    )
+    st.slider(
+        "Anthropic tokens/min",
+        min_value=10_000,
+        max_value=2_000_000,
+        value=TPM_DEFAULTS["anthropic"],
+        step=10_000,
+        key="anthropic_tpm",
+        help="Match this to your Anthropic account's TPM limit."
+    )
+
+async def summarize_dropped_turns(dropped):
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+    cache = get_response_cache()
+    cache_key = "summary-" + hashlib.blake2b(transcript.encode("utf-8")).hexdigest()
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    if openai_client is None:
+        return None
+    try:
+        response = await openai_client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[{
+                "role": "user",
+                "content": f"Briefly summarize the key points of this editorial discussion so it can serve as context for the conversation to continue:\n\n{transcript}"
+            }],
+            temperature=0.0
+        )
+        summary = response.choices[0].message.content.strip()
+    except Exception:
+        return None
+    cache.set(cache_key, summary, expire=86400)
+    return summary
+
+async def window_messages(model, messages):
+    window = st.session_state.get("context_window", CONTEXT_WINDOW_DEFAULT)
+    keep = 2 * window - 1
+    if len(messages) > 1 + keep:
+        # Cut at an assistant boundary so the sent list keeps alternating
+        # user/assistant roles - the history starts and ends with a user turn,
+        # and Anthropic rejects back-to-back same-role messages
+        split = len(messages) - keep
+        if messages[split]["role"] == "user":
+            split += 1
+        dropped = messages[1:split]
+        trimmed = [dict(messages[0])] + messages[split:]
+        summary = await summarize_dropped_turns(dropped)
+        if summary:
+            # Fold the summary into the initial user turn instead of inserting
+            # an extra user message, which would break the alternation
+            trimmed[0]["content"] = f"{trimmed[0]['content']}\n\nSummary of earlier discussion:\n{summary}"
+    else:
+        trimmed = list(messages)
+
+    # Safety valve: hard-cap input size by shedding the oldest windowed
+    # assistant/user pair at a time, preserving the role alternation
+    enc = get_encoding(model)
+    while len(trimmed) > 3 and sum(len(enc.encode(m["content"])) for m in trimmed) > MAX_INPUT_TOKENS:
+        del trimmed[1:3]
+    return trimmed
+
+# Transient failures (429s, connection blips, 5xx) are retried with jittered
+# exponential backoff instead of surfacing a dead result the user must re-run.
+# A Retry-After header, when present, overrides the computed wait.
+def _is_retryable_error(exception):
+    retryable = [openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError]
+    anthropic_module = sys.modules.get("anthropic")
+    if anthropic_module is not None:
+        retryable += [
+            anthropic_module.RateLimitError,
+            anthropic_module.APIConnectionError,
+            anthropic_module.InternalServerError
+        ]
+    return isinstance(exception, tuple(retryable))
+
+def _wait_respecting_retry_after(retry_state):
+    exception = retry_state.outcome.exception()
+    response = getattr(exception, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return tenacity.wait_random_exponential(min=1, max=30)(retry_state)
+
+llm_retry = tenacity.retry(
+    wait=_wait_respecting_retry_after,
+    stop=tenacity.stop_after_attempt(5),
+    retry=tenacity.retry_if_exception(_is_retryable_error),
+    reraise=True
+)
+
+@llm_retry
+async def stream_openai_response(model, messages, system_prompt, manuscript, placeholder):
+    text = ""
+    await acquire_rate_budget("openai", estimate_call_tokens(messages, system_prompt, manuscript))
+    stream = await openai_client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": composed_system_prompt(system_prompt, manuscript)}] + messages,
+        temperature=0.7,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            text += chunk.choices[0].delta.content
+            if placeholder is not None:
+                placeholder.markdown(text)
+    return text.strip()
+
+async def anthropic_manuscript_block(manuscript):
+    """Upload the manuscript once and return a document block referencing it.
+
+    The file id is cached in session state by content hash, so the N-model
+    fanout and every follow-up re-send a ~100-byte reference instead of the
+    full manuscript text.
+    """
+    file_ids = st.session_state.setdefault("anthropic_file_ids", {})
+    key = hashlib.blake2b(manuscript.encode("utf-8")).hexdigest()[:16]
+    if key not in file_ids:
+        uploaded = await anthropic_client.beta.files.upload(
+            file=("manuscript.txt", manuscript.encode("utf-8"), "text/plain")
+        )
+        file_ids[key] = uploaded.id
+    return {
+        "type": "document",
+        "source": {"type": "file", "file_id": file_ids[key]},
+        "cache_control": {"type": "ephemeral"}
+    }
+
+@llm_retry
+async def stream_anthropic_response(model, messages, system_prompt, manuscript, placeholder):
+    # Convert messages for Anthropic format
+    anthropic_messages = []
+    for msg in messages:
+        if msg["role"] != "system":
+            anthropic_messages.append(dict(msg))
+
+    # Prefer referencing the manuscript by uploaded file id; if the upload or
+    # the Files API beta fails, fall back to inlining it in the system blocks
+    doc_block = None
+    if manuscript and anthropic_messages:
+        try:
+            doc_block = await anthropic_manuscript_block(manuscript)
+        except Exception:
+            doc_block = None
+
+    text = ""
+    await acquire_rate_budget("anthropic", estimate_call_tokens(messages, system_prompt, manuscript))
+    if doc_block is not None:
+        first = anthropic_messages[0]
+        anthropic_messages[0] = {
+            "role": first["role"],
+            "content": [doc_block, {"type": "text", "text": first["content"]}]
+        }
+        stream_cm = anthropic_client.beta.messages.stream(
+            model=model,
+            max_tokens=4096,
+            temperature=0.7,
+            system=[{"type": "text", "text": system_prompt}],
+            messages=anthropic_messages,
+            betas=["files-api-2025-04-14"]
+        )
+    else:
+        stream_cm = anthropic_client.messages.stream(
+            model=model,
+            max_tokens=4096,
+            temperature=0.7,
+            system=anthropic_system_blocks(system_prompt, manuscript),
+            messages=anthropic_messages
+        )
+    async with stream_cm as stream:
+        async for delta in stream.text_stream:
+            text += delta
+            if placeholder is not None:
+                placeholder.markdown(text)
+    return text.strip()
+
+# Semantic cache layer: near-duplicate follow-ups ("give examples" vs "can
+# you give me examples") miss the exact-match cache, so the normalized last
+# user turn is embedded and compared against prior queries in the same
+# (model, system prompt, manuscript) scope; a cosine similarity above the
+# threshold returns the stored response without an LLM round-trip.
+# Embedding vectors are memoized in the disk cache, and concurrent requests
+# for the same text coalesce into one in-flight API call - the chunked fanout
+# embeds the identical feedback request once per (model, chunk) otherwise.
+# The task dict resets every script rerun, like the rate limiter dicts.
+_embedding_tasks = {}
+
+async def embed_query(key_text):
+    cache = get_response_cache()
+    digest = hashlib.blake2b(key_text.encode("utf-8")).hexdigest()
+    cached = cache.get(f"emb-{digest}")
+    if cached is not None:
+        return cached
+
+    key = (id(asyncio.get_running_loop()), digest)
+    task = _embedding_tasks.get(key)
+    if task is None:
+        async def _embed():
+            response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=key_text)
+            vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+            vector = vector / np.linalg.norm(vector)
+            cache.set(f"emb-{digest}", vector, expire=86400)
+            return vector
+        task = asyncio.ensure_future(_embed())
+        _embedding_tasks[key] = task
+    return await task
+
+async def semantic_cache_lookup(scope, key_text):
+    """Returns (cached_response_or_None, query_vector_or_None)."""
+    if openai_client is None:
+        return None, None
+    try:
+        query_vector = await embed_query(key_text)
+    except Exception:
+        return None, None
+    cache = get_response_cache()
+    matrix = cache.get(f"semvecs-{scope}")
+    if matrix is None or not len(matrix):
+        return None, query_vector
+    similarities = np.einsum("ij,j->i", matrix, query_vector)
+    best = int(np.argmax(similarities))
+    if similarities[best] > SEMANTIC_CACHE_THRESHOLD:
+        return cache.get(f"semresp-{scope}")[best], query_vector
+    return None, query_vector
+
+def semantic_cache_store(scope, query_vector, response_text):
+    cache = get_response_cache()
+    matrix = cache.get(f"semvecs-{scope}")
+    responses = cache.get(f"semresp-{scope}") or []
+    matrix = query_vector[None, :] if matrix is None else np.vstack([matrix, query_vector])
+    responses.append(response_text)
+    cache.set(f"semvecs-{scope}", matrix, expire=86400)
+    cache.set(f"semresp-{scope}", responses, expire=86400)
+
+# Function to get AI response. Responses are streamed token-by-token so the
+# first words appear in ~500ms instead of after the full completion; pass a
+# placeholder (st.empty) to render the text live as it arrives.
+#
+# The manuscript goes into the system block as a byte-identical prefix on
+# every turn so provider-side prompt caching kicks in: Anthropic via an
+# explicit cache_control breakpoint, OpenAI via automatic prefix caching on
+# system prompts >=1024 tokens. User messages stay short (just the request
+# or follow-up), so follow-ups only pay for the new tokens.
+async def get_ai_response_async(model, messages, system_prompt, manuscript, placeholder=None):
+    messages = await window_messages(model, messages)
+    cache = get_response_cache()
+    cache_key = response_cache_key(model, messages, system_prompt, manuscript)
+    cached = memo_cache_get(cache_key)
+    if cached is not None:
+        if placeholder is not None:
+            placeholder.markdown(cached)
+        return cached
+
+    # Short-circuit inputs that are guaranteed to fail server-side instead of
+    # paying the round-trip (and billing) for a context-length error
+    enc = get_encoding(model)
+    input_tokens = (
+        len(enc.encode(system_prompt))
+        + len(enc.encode(manuscript))
+        + sum(len(enc.encode(m["content"])) for m in messages)
+    )
+    if input_tokens + RESPONSE_TOKEN_BUDGET > MODEL_CONTEXTS.get(model, 128_000):
+        notice = f"⚠️ Skipped: input (~{input_tokens:,} tokens) exceeds {model}'s context window"
+        if placeholder is not None:
+            placeholder.warning(notice)
+        return notice
+
+    # Exact miss: check for a near-duplicate of the last user turn
+    scope = hashlib.blake2b(f"{model}|{system_prompt}|{manuscript}".encode("utf-8")).hexdigest()[:16]
+    key_text = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    semantic_hit, query_vector = await semantic_cache_lookup(scope, key_text)
+    if semantic_hit is not None:
+        if placeholder is not None:
+            placeholder.markdown(semantic_hit)
+        return semantic_hit
+
     try:
         if model in openai_models:
-            response = openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "system", "content": system_prompt}] + messages,
-                temperature=0.7
-            )
-            return response.choices[0].message.content.strip()
+            text = await stream_openai_response(model, messages, system_prompt, manuscript, placeholder)
         elif model in anthropic_models:
-            # Convert messages for Anthropic format
-            anthropic_messages = []
-            for msg in messages:
-                if msg["role"] != "system":
-                    anthropic_messages.append(msg)
-            
-            response = anthropic_client.messages.create(
-                model=model,
-                max_tokens=4096,
-                temperature=0.7,
-                system=system_prompt,
-                messages=anthropic_messages
-            )
-            return response.content[0].text.strip()
+            text = await stream_anthropic_response(model, messages, system_prompt, manuscript, placeholder)
+        else:
+            return f"❌ Error: Unknown model {model}"
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
+    # Don't cache error strings - only successful responses are worth replaying
+    cache.set(cache_key, text, expire=86400)
+    memo_cache_put(cache_key, text)
+    if query_vector is not None:
+        semantic_cache_store(scope, query_vector, text)
+    return text
+
+def get_ai_response(model, messages, system_prompt, manuscript, placeholder=None):
+    return run_async(get_ai_response_async(model, messages, system_prompt, manuscript, placeholder))
+
+# Batch mode: jobs that don't need synchronous output go through the provider
+# batch APIs (OpenAI Batch, Anthropic Message Batches) at 50% of the per-token
+# price and without counting against per-minute rate limits.
+def submit_batch_jobs(models, feedback_request, system_prompt, manuscript):
+    openai_batch_models = [m for m in models if m in openai_models]
+    anthropic_batch_models = [m for m in models if m in anthropic_models]
+
+    async def _submit():
+        batch_ids = {}
+        if openai_batch_models:
+            lines = []
+            for model in openai_batch_models:
+                body = {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": composed_system_prompt(system_prompt, manuscript)},
+                        {"role": "user", "content": feedback_request}
+                    ],
+                    "temperature": 0.7
+                }
+                lines.append(json.dumps({
+                    "custom_id": model,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body
+                }))
+            batch_file = await openai_client.files.create(
+                file=("feedback_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await openai_client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            batch_ids["openai"] = batch.id
+        if anthropic_batch_models:
+            batch = await anthropic_client.messages.batches.create(
+                requests=[{
+                    "custom_id": model,
+                    "params": {
+                        "model": model,
+                        "max_tokens": 4096,
+                        "temperature": 0.7,
+                        "system": anthropic_system_blocks(system_prompt, manuscript),
+                        "messages": [{"role": "user", "content": feedback_request}]
+                    }
+                } for model in anthropic_batch_models]
+            )
+            batch_ids["anthropic"] = batch.id
+        return batch_ids
+
+    return run_async(_submit())
+
+def collect_batch_results(batch_ids, models):
+    """Poll pending batches; returns (results_by_model, all_done).
+
+    Failures become "❌ Error:" entries per model, same as the sync path, so
+    they survive the rerun and render in the conversation instead of being
+    flashed and discarded.
+    """
+    openai_batch_models = [m for m in models if m in openai_models]
+    anthropic_batch_models = [m for m in models if m in anthropic_models]
+
+    async def _collect_openai():
+        results = {}
+        done = True
+        batch = await openai_client.batches.retrieve(batch_ids["openai"])
+        if batch.status == "completed":
+            # A batch whose every request errored still completes, but with
+            # no output file; per-request failures land in the output lines
+            if batch.output_file_id:
+                output = await openai_client.files.content(batch.output_file_id)
+                for line in output.text.splitlines():
+                    record = json.loads(line)
+                    response = record.get("response") or {}
+                    error = record.get("error")
+                    if error or response.get("status_code", 200) != 200:
+                        detail = (error or {}).get("message") or f"HTTP {response.get('status_code')}"
+                        results[record["custom_id"]] = f"❌ Error: batch request failed ({detail})"
+                    else:
+                        results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+        elif batch.status in ("failed", "expired", "cancelled"):
+            for model in openai_batch_models:
+                results[model] = f"❌ Error: OpenAI batch {batch.id} ended with status: {batch.status}"
+        else:
+            done = False
+        return results, done
+
+    async def _collect_anthropic():
+        results = {}
+        done = True
+        batch = await anthropic_client.messages.batches.retrieve(batch_ids["anthropic"])
+        if batch.processing_status == "ended":
+            async for entry in await anthropic_client.messages.batches.results(batch_ids["anthropic"]):
+                if entry.result.type == "succeeded":
+                    results[entry.custom_id] = entry.result.message.content[0].text.strip()
+                else:
+                    results[entry.custom_id] = f"❌ Error: batch request ended with: {entry.result.type}"
+        else:
+            done = False
+        return results, done
+
+    async def _collect():
+        # Poll both providers concurrently rather than one after the other
+        pollers = []
+        if "openai" in batch_ids:
+            pollers.append(_collect_openai())
+        if "anthropic" in batch_ids:
+            pollers.append(_collect_anthropic())
+        results = {}
+        all_done = True
+        for provider_results, done in await asyncio.gather(*pollers):
+            results.update(provider_results)
+            all_done = all_done and done
+        return results, all_done
+
+    return run_async(_collect())
+
+# Build the export DOCX once per unique conversation state; reruns that don't
+# change the conversation reuse the cached bytes instead of re-serializing.
+# The builder returns immutable bytes (no BytesIO handed around, no seek(0)),
+# so the download button reuses the same object instead of re-copying a
+# buffer on every rerun.
+@st.cache_data(show_spinner=False)
+def build_docx(editor_name: str, editor_prompt: str, manuscript: str, convo_snapshot: tuple) -> bytes:
+    return build_docx_bytes(editor_name, editor_prompt, manuscript, convo_snapshot)
+
+# Single background worker so the DOCX serialization overlaps with rendering
+# the conversation instead of blocking the script run at the export section
+@st.cache_resource
+def get_docx_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="docx-build")
+
 # Run initial feedback
 st.subheader("🚀 Generate Feedback")
+batch_mode = st.checkbox(
+    "📦 Submit as batch (50% cheaper, completes later)",
+    help="Send the feedback job through the provider batch APIs at half the per-token price. Results typically arrive within minutes to hours."
+)
 run_button = st.button("📝 Get Editorial Feedback", type="primary")
 
 if run_button:
@@ -200,171 +869,306 @@ if run_button:
     else:
         # Reset conversation history for new feedback session
         st.session_state.conversation_history = {}
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
+
         system_prompt = f"You are a brilliant fiction editor named {editor_name}. Provide constructive, detailed feedback on the user's manuscript. Be specific, actionable, and encouraging while identifying areas for improvement."
-        initial_message = f"Manuscript:\n{manuscript_input}\n\nFeedback Request:\n{editor_prompt}"
-        
-        for i, model in enumerate(selected_models):
-            status_text.text(f"Getting feedback from {model}...")
-            progress_bar.progress((i) / len(selected_models))
-            
-            # Initialize conversation history for each model
-            st.session_state.conversation_history[model] = {
-                "messages": [{"role": "user", "content": initial_message}],
-                "system_prompt": system_prompt
-            }
-            
-            response = get_ai_response(model, st.session_state.conversation_history[model]["messages"], system_prompt)
+        initial_message = f"Feedback Request:\n{editor_prompt}"
+
+        if batch_mode:
+            try:
+                batch_ids = submit_batch_jobs(selected_models, initial_message, system_prompt, manuscript_input)
+                st.session_state.pending_batch = {
+                    "ids": batch_ids,
+                    "models": list(selected_models),
+                    "system_prompt": system_prompt,
+                    "manuscript": manuscript_input,
+                    "initial_message": initial_message
+                }
+                st.info(f"📦 Batch submitted ({', '.join(batch_ids.values())}). Use \"Check batch status\" below to collect results.")
+            except Exception as e:
+                st.error(f"❌ Batch submission failed: {str(e)}")
+        else:
+            if chunk_separator:
+                chunks = [c.strip() for c in manuscript_input.split(chunk_separator)]
+                chunks = [c for c in chunks if c]
+            elif count_tokens(manuscript_input, "gpt-4o") > AUTO_CHUNK_THRESHOLD:
+                chunks = chunk_manuscript(manuscript_input, "gpt-4o")
+                st.info(f"📚 Large manuscript: split into {len(chunks)} overlapping chunks for parallel feedback.")
+            else:
+                chunks = [manuscript_input]
+            st.session_state.chunk_feedback = {}
+
+            # Initialize conversation history for each model. The manuscript is
+            # stored once in session state rather than inside every history, so
+            # session size stays O(manuscript) instead of O(models x manuscript),
+            # and the initial message dict is shared (never mutated) across models.
+            st.session_state.manuscript = manuscript_input
+            initial_user_message = {"role": "user", "content": initial_message}
+            for model in selected_models:
+                st.session_state.conversation_history[model] = {
+                    "messages": [initial_user_message],
+                    "system_prompt": system_prompt
+                }
+
+            if len(chunks) > 1:
+                # Per-chunk fanout: every (model, chunk) pair is its own request,
+                # bounded by a semaphore so we don't burst past rate limits.
+                # One st.status container collects the per-completion log lines,
+                # so each finished call appends a line instead of driving a
+                # separate progress-bar patch over the websocket.
+                with st.status(f"📝 Getting feedback on {len(chunks)} chunks from {len(selected_models)} model(s)...", expanded=True) as status:
+                    async def run_chunked_fanout():
+                        semaphore = asyncio.Semaphore(st.session_state.get("max_concurrency", MAX_CONCURRENT_REQUESTS))
+
+                        async def call_chunk(model, idx, chunk):
+                            chunk_message = {"role": "user", "content": initial_message}
+                            async with semaphore:
+                                response = await get_ai_response_async(model, [chunk_message], system_prompt, chunk)
+                            return model, idx, response
+
+                        total = len(selected_models) * len(chunks)
+                        tasks = [
+                            asyncio.ensure_future(call_chunk(model, idx, chunk))
+                            for model in selected_models
+                            for idx, chunk in enumerate(chunks)
+                        ]
+                        results = {model: [None] * len(chunks) for model in selected_models}
+                        completed = 0
+                        for finished in asyncio.as_completed(tasks):
+                            model, idx, response = await finished
+                            results[model][idx] = response
+                            completed += 1
+                            status.write(f"✅ {model} chunk {idx + 1} finished ({completed}/{total})")
+                        return results
+
+                    chunk_results = run_async(run_chunked_fanout())
+
+                    # Reduce step: each model synthesizes its own chunk-level notes
+                    # into one coherent set of feedback
+                    async def synthesize_chunk_notes():
+                        async def synthesize(model):
+                            notes = "\n\n".join(
+                                f"Chunk {idx + 1} notes:\n{text}" for idx, text in enumerate(chunk_results[model])
+                            )
+                            message = {
+                                "role": "user",
+                                "content": f"Below are your own chunk-by-chunk editorial notes on a manuscript. Synthesize them into one coherent set of feedback, removing repetition and highlighting the most important points:\n\n{notes}"
+                            }
+                            try:
+                                return model, await get_ai_response_async(model, [message], system_prompt, "")
+                            except Exception as e:
+                                return model, f"❌ Error: {str(e)}"
+                        return dict(await asyncio.gather(*[synthesize(model) for model in selected_models]))
+
+                    status.write("🧠 Synthesizing chunk-level notes...")
+                    synthesized = run_async(synthesize_chunk_notes())
+                    for model in selected_models:
+                        st.session_state.chunk_feedback[model] = chunk_results[model]
+                        summary = synthesized[model]
+                        if summary.startswith("❌ Error:"):
+                            # Fall back to the raw concatenation if synthesis failed
+                            summary = "\n\n".join(
+                                f"**Chunk {idx + 1}:**\n\n{text}" for idx, text in enumerate(chunk_results[model])
+                            )
+                        st.session_state.conversation_history[model]["messages"].append({"role": "assistant", "content": summary})
+                    status.update(label="✅ Feedback generation complete!", state="complete")
+            else:
+                # Fan out all model calls concurrently - the work is network-bound,
+                # so total wall time is ~max(latency) instead of sum(latencies).
+                # Each model streams into its own expander as tokens arrive, so
+                # the fastest model is readable while the slowest still runs.
+                live_placeholders = {}
+                for model in selected_models:
+                    with st.expander(f"💡 {model} (streaming)", expanded=True):
+                        live_placeholders[model] = st.empty()
+
+                with st.status(f"📝 Getting feedback from {len(selected_models)} model(s)...", expanded=True) as status:
+                    async def run_fanout():
+                        async def call_model(model):
+                            try:
+                                response = await get_ai_response_async(
+                                    model,
+                                    st.session_state.conversation_history[model]["messages"],
+                                    system_prompt,
+                                    manuscript_input,
+                                    placeholder=live_placeholders[model]
+                                )
+                            except Exception as e:
+                                # Keep one model's unexpected failure from killing
+                                # the whole gather - surface it like an API error
+                                response = f"❌ Error: {str(e)}"
+                            return model, response
+
+                        tasks = [asyncio.ensure_future(call_model(model)) for model in selected_models]
+                        completed = 0
+                        for finished in asyncio.as_completed(tasks):
+                            model, response = await finished
+                            st.session_state.conversation_history[model]["messages"].append({"role": "assistant", "content": response})
+                            if response.startswith("❌ Error:"):
+                                # Failures never streamed anything - surface them
+                                # in the model's live slot instead of leaving it blank
+                                live_placeholders[model].error(response)
+                            completed += 1
+                            status.write(f"✅ {model} finished ({completed}/{len(selected_models)})")
+
+                    run_async(run_fanout())
+                    status.update(label="✅ Feedback generation complete!", state="complete")
+
+            st.session_state.feedback_generated = True
+            # Redraw cleanly so the live streaming area is replaced by the
+            # regular conversation view instead of duplicating it
+            st.rerun()
+
+# Pending batch results
+if st.session_state.get("pending_batch"):
+    pending = st.session_state.pending_batch
+    st.info(f"📦 Batch in flight: {', '.join(pending['ids'].values())}")
+    if st.button("🔄 Check batch status"):
+        poll_failed = False
+        try:
+            results, all_done = collect_batch_results(pending["ids"], pending["models"])
+        except Exception as e:
+            results, all_done, poll_failed = {}, False, True
+            st.error(f"❌ Batch status check failed: {str(e)}")
+        if all_done:
+            st.session_state.manuscript = pending["manuscript"]
+            # Batch runs have no per-chunk notes; drop any left over from a
+            # previous chunked run so they don't render under these responses
+            st.session_state.chunk_feedback = {}
+            for model in pending["models"]:
+                # Models the batch returned nothing for still get an entry, so
+                # the failure is visible in the conversation after the rerun
+                content = results.get(model, "❌ Error: the batch returned no result for this model")
+                st.session_state.conversation_history[model] = {
+                    "messages": [
+                        {"role": "user", "content": pending["initial_message"]},
+                        {"role": "assistant", "content": content}
+                    ],
+                    "system_prompt": pending["system_prompt"]
+                }
+            st.session_state.feedback_generated = True
+            st.session_state.pending_batch = None
+            st.rerun()
+        elif not poll_failed:
+            st.info("⏳ Batch still processing — check again in a few minutes.")
+
+def render_assistant_message(model, turn_index, content):
+    if content.startswith("❌ Error:"):
+        st.error(content)
+        return
+    if content.startswith("⚠️ Skipped:"):
+        st.warning(content)
+        return
+    st.markdown("**🤖 Response:**")
+    st.write(content)
+    chunk_texts = st.session_state.get("chunk_feedback", {}).get(model)
+    if turn_index == 1 and chunk_texts:
+        # Chunked runs show the synthesized feedback above and the raw
+        # chunk-level notes in one expander per manuscript chunk
+        for idx, text in enumerate(chunk_texts):
+            with st.expander(f"📄 Chunk {idx + 1} notes"):
+                st.write(text)
+
+# Each model's conversation lives in its own fragment: a follow-up in one
+# tab reruns only that fragment instead of re-rendering every other tab
+# (and the rest of the page) on each interaction.
+@st.fragment
+def render_model_conversation(model):
+    # Display conversation history
+    for j, message in enumerate(st.session_state.conversation_history[model]["messages"]):
+        if message["role"] == "user":
+            if j == 0:  # First message is the original feedback request
+                st.markdown("**📝 Your Original Request:**")
+            else:
+                st.markdown("**❓ Your Follow-up:**")
+            st.markdown(f"*{message['content']}*")
+        elif message["role"] == "assistant":
+            render_assistant_message(model, j, message["content"])
+        st.markdown("---")
+
+    # Follow-up question input for this model
+    follow_up = st.text_area(
+        f"💬 Ask a follow-up question to {model}:",
+        key=f"follow_up_{model}",
+        placeholder="e.g., 'Can you give specific examples?', 'How would you rewrite this section?'",
+        help="Continue the conversation with this model for deeper insights."
+    )
+
+    if st.button(f"Send to {model}", key=f"send_{model}"):
+        if follow_up.strip():
+            # Add user's follow-up to conversation
+            st.session_state.conversation_history[model]["messages"].append({"role": "user", "content": follow_up})
+
+            # Stream the AI response into a live placeholder
+            st.markdown("**🤖 Response:**")
+            response = get_ai_response(
+                model,
+                st.session_state.conversation_history[model]["messages"],
+                st.session_state.conversation_history[model]["system_prompt"],
+                st.session_state.manuscript,
+                placeholder=st.empty()
+            )
+
+            # Add AI response to conversation
             st.session_state.conversation_history[model]["messages"].append({"role": "assistant", "content": response})
-        
-        progress_bar.progress(1.0)
-        status_text.text("✅ Feedback generation complete!")
-        st.session_state.feedback_generated = True
+
+            # Full rerun (not fragment-scoped): the export snapshot lives
+            # outside the fragment, and a scoped rerun would leave the
+            # download button serving a DOCX missing this exchange. The page
+            # redraw is trivial next to the API round-trip we just paid; the
+            # fragment still spares the page on the typing/rendering path.
+            st.rerun()
+        else:
+            st.warning("Please enter a follow-up question.")
 
 # Show results and conversation interface
 if st.session_state.feedback_generated and st.session_state.conversation_history:
     st.subheader("📘 Editorial Feedback & Conversation")
-    
+
+    # Kick off the (cached) DOCX build in the background now; it runs while
+    # the conversation below renders and is usually done before the download
+    # button needs the bytes. The snapshot is hashable so the build is only
+    # redone when the conversation actually changes.
+    convo_snapshot = tuple(
+        (model, tuple((msg["role"], msg["content"]) for msg in st.session_state.conversation_history[model]["messages"]))
+        for model in selected_models
+        if model in st.session_state.conversation_history
+    )
+    # Skip even the executor dispatch and cache hash when nothing changed
+    # since the last build - the common case for widget-only reruns
+    docx_key = hash((editor_name, editor_prompt, convo_snapshot))
+    if st.session_state.get("docx_cache_key") == docx_key:
+        docx_future = None
+    else:
+        docx_future = get_docx_executor().submit(
+            build_docx, editor_name, editor_prompt, st.session_state.get("manuscript", manuscript_input), convo_snapshot
+        )
+
     # Create tabs for each model
     if len(selected_models) > 1:
         tabs = st.tabs([f"💡 {model}" for model in selected_models])
-        
+
         for i, model in enumerate(selected_models):
             with tabs[i]:
-                # Display conversation history
-                for j, message in enumerate(st.session_state.conversation_history[model]["messages"]):
-                    if message["role"] == "user":
-                        if j == 0:  # First message is the original feedback request
-                            st.markdown("**📝 Your Original Request:**")
-                        else:
-                            st.markdown("**❓ Your Follow-up:**")
-                        st.markdown(f"*{message['content']}*")
-                    elif message["role"] == "assistant":
-                        if not message["content"].startswith("❌ Error:"):
-                            st.markdown("**🤖 Response:**")
-                            st.write(message["content"])
-                        else:
-                            st.error(message["content"])
-                    st.markdown("---")
-                
-                # Follow-up question input for this model
-                follow_up_key = f"follow_up_{model}"
-                follow_up = st.text_area(
-                    f"💬 Ask a follow-up question to {model}:",
-                    key=follow_up_key,
-                    placeholder="e.g., 'Can you give specific examples?', 'How would you rewrite this section?'",
-                    help="Continue the conversation with this model for deeper insights."
-                )
-                
-                if st.button(f"Send to {model}", key=f"send_{model}"):
-                    if follow_up.strip():
-                        with st.spinner(f"Getting response from {model}..."):
-                            # Add user's follow-up to conversation
-                            st.session_state.conversation_history[model]["messages"].append({"role": "user", "content": follow_up})
-                            
-                            # Get AI response
-                            response = get_ai_response(
-                                model, 
-                                st.session_state.conversation_history[model]["messages"], 
-                                st.session_state.conversation_history[model]["system_prompt"]
-                            )
-                            
-                            # Add AI response to conversation
-                            st.session_state.conversation_history[model]["messages"].append({"role": "assistant", "content": response})
-                        
-                        st.rerun()
-                    else:
-                        st.warning("Please enter a follow-up question.")
-    
+                render_model_conversation(model)
     else:
         # Single model interface
         model = selected_models[0]
         st.markdown(f"### 💡 Conversation with {model}")
-        
-        # Display conversation history
-        for j, message in enumerate(st.session_state.conversation_history[model]["messages"]):
-            if message["role"] == "user":
-                if j == 0:  # First message is the original feedback request
-                    st.markdown("**📝 Your Original Request:**")
-                else:
-                    st.markdown("**❓ Your Follow-up:**")
-                st.markdown(f"*{message['content']}*")
-            elif message["role"] == "assistant":
-                if not message["content"].startswith("❌ Error:"):
-                    st.markdown("**🤖 Response:**")
-                    st.write(message["content"])
-                else:
-                    st.error(message["content"])
-            st.markdown("---")
-        
-        # Follow-up question input
-        follow_up = st.text_area(
-            f"💬 Ask a follow-up question to {model}:",
-            placeholder="e.g., 'Can you give specific examples?', 'How would you rewrite this section?'",
-            help="Continue the conversation with this model for deeper insights."
-        )
-        
-        if st.button(f"Send to {model}"):
-            if follow_up.strip():
-                with st.spinner(f"Getting response from {model}..."):
-                    # Add user's follow-up to conversation
-                    st.session_state.conversation_history[model]["messages"].append({"role": "user", "content": follow_up})
-                    
-                    # Get AI response
-                    response = get_ai_response(
-                        model, 
-                        st.session_state.conversation_history[model]["messages"], 
-                        st.session_state.conversation_history[model]["system_prompt"]
-                    )
-                    
-                    # Add AI response to conversation
-                    st.session_state.conversation_history[model]["messages"].append({"role": "assistant", "content": response})
-                
-                st.rerun()
-            else:
-                st.warning("Please enter a follow-up question.")
-    
+        render_model_conversation(model)
+
     # Download functionality
     st.subheader("📥 Export Conversation")
-    
-    # Generate DOCX file with full conversation
-    doc = Document()
-    doc.add_heading('AI Manuscript Editor - Full Conversation', 0)
-    doc.add_paragraph(f'Editor Persona: {editor_name}')
-    doc.add_paragraph(f'Original Feedback Request: {editor_prompt}')
-    doc.add_paragraph('')
-    doc.add_heading('Original Manuscript Excerpt', level=1)
-    doc.add_paragraph(manuscript_input)
-    doc.add_paragraph('')
-    
-    for model in selected_models:
-        if model in st.session_state.conversation_history:
-            doc.add_heading(f'Conversation with {model}', level=1)
-            
-            for j, message in enumerate(st.session_state.conversation_history[model]["messages"]):
-                if message["role"] == "user":
-                    if j == 0:
-                        doc.add_heading('Original Request', level=2)
-                    else:
-                        doc.add_heading('Follow-up Question', level=2)
-                    doc.add_paragraph(message["content"])
-                elif message["role"] == "assistant" and not message["content"].startswith("❌ Error:"):
-                    doc.add_heading('Response', level=2)
-                    doc.add_paragraph(message["content"])
-                doc.add_paragraph('')
-    
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    
+
+    if docx_future is not None:
+        st.session_state.docx_bytes = docx_future.result()
+        st.session_state.docx_cache_key = docx_key
+    docx_bytes = st.session_state.docx_bytes
+
     col1, col2, col3 = st.columns([1, 1, 2])
     with col1:
         st.download_button(
             label="📥 Download Full Conversation",
-            data=buffer,
+            data=docx_bytes,
             file_name="manuscript_conversation.docx",
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             type="primary"
@@ -372,6 +1176,7 @@ if st.session_state.feedback_generated and st.session_state.conversation_history
     with col2:
         if st.button("🔄 Start New Session", type="secondary"):
             st.session_state.conversation_history = {}
+            st.session_state.chunk_feedback = {}
             st.session_state.feedback_generated = False
             st.rerun()
     with col3: